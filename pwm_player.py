@@ -18,6 +18,9 @@ Notes:
 """
 
 import argparse
+import queue
+import threading
+import time
 import wave
 import sys
 import os
@@ -28,52 +31,367 @@ except ImportError:
     print("pigpio module not found. Install with: pip3 install pigpio", file=sys.stderr)
     raise
 
+try:
+    import numpy as np
+except ImportError:
+    np = None  # optional; a bytes.translate fallback covers decode
 
-def wav_to_samples(wav_path):
-    wf = wave.open(wav_path, 'rb')
-    channels = wf.getnchannels()
-    sampwidth = wf.getsampwidth()
-    framerate = wf.getframerate()
-    nframes = wf.getnframes()
 
-    if channels != 1:
-        raise ValueError('Only mono WAV supported for this simple player')
+# Map an 8-bit sample (0..255) to a hardware_PWM duty cycle (0..1000000).
+# Precomputed once so the streaming loop does a single index instead of
+# a multiply/divide per sample.
+DUTY_LUT = [(s * 1000000) // 255 for s in range(256)]
+
+# Samples per pigpio wave. Keeps the pulse count of one wave comfortably
+# under the daemon's per-wave limit (~12000 pulses) at typical rates.
+WAVE_CHUNK = 1024
 
-    raw = wf.readframes(nframes)
-    wf.close()
+# XOR the sign bit of every byte in one bytes.translate call; the MSB of a
+# little-endian int16 sample, sign-flipped, equals (v + 32768) >> 8.
+_SIGN_FLIP = bytes(b ^ 0x80 for b in range(256))
 
-    # Convert to 8-bit unsigned samples for PWM duty mapping
+
+def _decoder_for(sampwidth):
+    """Return the raw-frames -> 8-bit-sample converter for a sample width.
+
+    The dispatch on width and numpy availability happens here, once per
+    file, so the chunk loop calls a specialized converter with no
+    per-chunk branching. numpy does each buffer in a few C loops instead
+    of one Python int per sample; without numpy, slicing plus
+    bytes.translate stays at C speed too.
+    """
     if sampwidth == 1:
         # 8-bit unsigned
-        samples = list(raw)
+        if np is None:
+            return lambda raw: raw
+        return lambda raw: np.frombuffer(raw, dtype=np.uint8).copy()
     elif sampwidth == 2:
-        # 16-bit signed little endian -> convert to 8-bit unsigned
-        import struct
-        fmt = '<{}h'.format(nframes)
-        vals = struct.unpack(fmt, raw)
-        samples = [int((v + 32768) >> 8) for v in vals]
+        # 16-bit signed little endian -> convert to 8-bit unsigned.
+        # (v + 32768) >> 8 on the signed value equals a narrowing shift of
+        # the unsigned view with the sign bit flipped, so the conversion
+        # stays in 16-bit lanes instead of widening to int32 first.
+        if np is None:
+            return lambda raw: raw[1::2].translate(_SIGN_FLIP)
+        return lambda raw: ((np.frombuffer(raw, dtype='<u2') >> 8) ^ 0x80).astype(np.uint8)
     else:
         raise ValueError('Unsupported sample width: {} bytes'.format(sampwidth))
 
+
+def wav_chunks(wav_path, chunk=4096):
+    """Open a mono WAV and return (chunks, framerate).
+
+    chunks is a generator yielding uint8 ndarrays of up to `chunk` frames,
+    decoded lazily. Peak memory stays bounded to one chunk and playback can
+    start after the first block instead of after whole-file decode. The file
+    is validated eagerly and closed when the generator is exhausted.
+    """
+    wf = wave.open(wav_path, 'rb')
+    try:
+        if wf.getnchannels() != 1:
+            raise ValueError('Only mono WAV supported for this simple player')
+        decode = _decoder_for(wf.getsampwidth())
+        framerate = wf.getframerate()
+    except Exception:
+        wf.close()
+        raise
+
+    def gen():
+        try:
+            while True:
+                raw = wf.readframes(chunk)
+                if not raw:
+                    break
+                yield decode(raw)
+        finally:
+            wf.close()
+
+    return gen(), framerate
+
+
+def wav_to_samples(wav_path):
+    """Decode a whole mono WAV into one uint8 sample array (see wav_chunks)."""
+    chunks, framerate = wav_chunks(wav_path)
+    parts = list(chunks)
+    if np is None:
+        samples = b''.join(parts)
+    else:
+        samples = np.concatenate(parts) if parts else np.empty(0, dtype=np.uint8)
     return samples, framerate
 
 
-def stream_pwm(samples, sr, gpio, pi):
-    # pigpio hardware PWM supports frequency and dutycycle (0-1e6)
-    # We'll approximate by setting a carrier frequency and updating duty cycle rapidly.
-    carrier = 25000  # 25 kHz carrier frequency
+def _realtime_priority():
+    """Reduce duty-update jitter for the calling (streaming) thread.
+
+    Pins the thread to the last CPU and requests SCHED_FIFO priority so
+    the scheduler doesn't bounce or preempt it mid-stream. The scheduler
+    change needs CAP_SYS_NICE (or root); without it, and on platforms
+    lacking these calls, the defaults are kept silently. For the lowest
+    jitter the chosen core can also be isolated with the isolcpus= boot
+    argument.
+    """
+    try:
+        os.sched_setaffinity(0, {os.cpu_count() - 1})
+    except (AttributeError, OSError):
+        pass
+    try:
+        os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(50))
+    except (AttributeError, PermissionError, OSError):
+        pass
+
+
+def stream_pwm(chunks, sr, gpio, pi, carrier=25000):
+    _realtime_priority()
+    # Program the carrier frequency and duty range once, then only update
+    # the duty per sample. set_PWM_dutycycle is the lighter daemon path than
+    # hardware_PWM (which re-applies the frequency config on every call),
+    # and with the range set to 255 the 8-bit sample IS the duty cycle.
+    # Note: this still pays one daemon round trip per changed sample;
+    # prefer stream_pwm_wave.
     pi.set_mode(gpio, pigpio.OUTPUT)
-    # Start with 0 duty
-    pi.hardware_PWM(gpio, carrier, 0)
+    pi.set_PWM_frequency(gpio, carrier)
+    pi.set_PWM_range(gpio, 255)
+    pi.set_PWM_dutycycle(gpio, 0)
 
-    # Duty range for hardware_PWM is 0..1000000
-    for s in samples:
-        duty = int(s * 1000000 / 255)
-        pi.hardware_PWM(gpio, carrier, duty)
+    # Speech has long runs of identical 8-bit samples (silence, slow
+    # envelopes); skip the daemon round trip when the duty has not changed.
+    prev = -1
+    for chunk in chunks:
+        for s in chunk:
+            if s != prev:
+                pi.set_PWM_dutycycle(gpio, s)
+                prev = s
     # Stop
+    pi.set_PWM_dutycycle(gpio, 0)
+
+
+# pigpio socket opcode for hardware_PWM (matches _PI_CMD_HP in pigpio.py).
+_PI_CMD_HP = 86
+
+
+def stream_pwm_socket(chunks, sr, gpio, pi, carrier=25000, batch=256):
+    """Pipeline hardware_PWM command frames straight over the daemon socket.
+
+    pigpio's hardware_PWM method sends one command frame and blocks on its
+    reply before the next call can start, so the interpreter and the socket
+    round trip are both paid per sample. The frame format is trivial (four
+    uint32s plus the duty as a 4-byte extension), so build a batch of frames
+    ourselves, push them with a single sendall and drain the replies
+    afterwards. Same wire traffic, a fraction of the per-sample overhead.
+
+    Relies on the pigpio python client's internal socket (pi.sl); falls back
+    to stream_pwm if that layout ever changes.
+    """
+    import struct
+
+    try:
+        sock = pi.sl.s
+        lock = pi.sl.l
+    except AttributeError:
+        stream_pwm(chunks, sr, gpio, pi, carrier=carrier)
+        return
+
+    _realtime_priority()
+    pi.set_mode(gpio, pigpio.OUTPUT)
+    frame = struct.Struct('IIIII')
+    prev = -1
+    with lock:
+        for chunk in chunks:
+            for start in range(0, len(chunk), batch):
+                frames = []
+                for s in chunk[start:start + batch]:
+                    if s != prev:
+                        frames.append(frame.pack(_PI_CMD_HP, gpio, carrier, 4, DUTY_LUT[s]))
+                        prev = s
+                if not frames:
+                    continue
+                sock.sendall(b''.join(frames))
+                # One 16-byte reply per command; drain them all in bulk.
+                need = 16 * len(frames)
+                while need:
+                    need -= len(sock.recv(need))
     pi.hardware_PWM(gpio, 0, 0)
 
 
+# pigpio scripts take at most 10 parameters per run.
+_SCRIPT_PARAMS = 10
+
+
+def stream_pwm_script(chunks, sr, gpio, pi, carrier=25000):
+    """Run the duty-update loop inside pigpiod via a stored script.
+
+    A script with one hardware_PWM + delay step per parameter is uploaded
+    once; each run_script call then hands the daemon a block of
+    _SCRIPT_PARAMS duty values which it clocks out locally, so the steady
+    state costs one client round trip per block instead of per sample.
+    """
+    period_us = 1000000 // sr
+    script = ' '.join('hp {} {} p{} mics {}'.format(gpio, carrier, i, period_us)
+                      for i in range(_SCRIPT_PARAMS))
+
+    _realtime_priority()
+    pi.set_mode(gpio, pigpio.OUTPUT)
+    sid = pi.store_script(script)
+    try:
+        while pi.script_status(sid)[0] == pigpio.PI_SCRIPT_INITING:
+            time.sleep(0.001)
+        for chunk in chunks:
+            duties = [DUTY_LUT[s] for s in chunk]
+            for start in range(0, len(duties), _SCRIPT_PARAMS):
+                block = duties[start:start + _SCRIPT_PARAMS]
+                if len(block) < _SCRIPT_PARAMS:
+                    # Pad a short tail with its last duty so the script
+                    # always consumes all of its parameters.
+                    block += [block[-1]] * (_SCRIPT_PARAMS - len(block))
+                pi.run_script(sid, block)
+                while pi.script_status(sid)[0] == pigpio.PI_SCRIPT_RUNNING:
+                    pass
+    finally:
+        pi.delete_script(sid)
+        pi.hardware_PWM(gpio, 0, 0)
+
+
+def _sample_pulses(samples, bit, cycles, cycle_us, on_lut):
+    """Build the pigpio pulse list encoding one chunk of samples as PWM."""
+    pulses = []
+    for s in samples:
+        on = on_lut[s]
+        if on == 0:
+            # Extend the previous pulse if the line is already held low,
+            # so runs of silence collapse into a single long pulse.
+            if pulses and pulses[-1].gpio_off == bit:
+                pulses[-1].delay += cycles * cycle_us
+            else:
+                pulses.append(pigpio.pulse(0, bit, cycles * cycle_us))
+        elif on >= cycle_us:
+            if pulses and pulses[-1].gpio_on == bit and pulses[-1].gpio_off == 0:
+                pulses[-1].delay += cycles * cycle_us
+            else:
+                pulses.append(pigpio.pulse(bit, 0, cycles * cycle_us))
+        else:
+            for _ in range(cycles):
+                pulses.append(pigpio.pulse(bit, 0, on))
+                pulses.append(pigpio.pulse(0, bit, cycle_us - on))
+    return pulses
+
+
+def _is_constant(block):
+    """True if every sample in the block has the same value."""
+    if np is not None and isinstance(block, np.ndarray):
+        return bool((block == block[0]).all())
+    return block.count(block[0]) == len(block)
+
+
+def stream_pwm_wave(chunks, sr, gpio, pi, carrier=25000):
+    """Stream samples as pigpio waveforms instead of per-sample duty updates.
+
+    Each WAVE_CHUNK block of samples is encoded as a pulse train (duty per
+    carrier cycle) and handed to the daemon in one round trip; the daemon
+    clocks it out with DMA timing. Waves are double-buffered with
+    WAVE_MODE_ONE_SHOT_SYNC so the next chunk is queued before the current
+    one finishes, hiding the client/daemon latency.
+
+    Blocks where every sample is identical (silence, held notes) are sent
+    as a one-sample wave that the daemon loops in place via wave_chain, so
+    long flat stretches cost a handful of pulses instead of a full train.
+    """
+    pi.set_mode(gpio, pigpio.OUTPUT)
+    pi.wave_clear()
+
+    cycle_us = 1000000 // carrier
+    period_us = 1000000 // sr
+    cycles = max(1, period_us // cycle_us)
+    on_lut = [(s * cycle_us) // 255 for s in range(256)]
+    bit = 1 << gpio
+
+    prev_wid = None
+    try:
+        for chunk in chunks:
+            for start in range(0, len(chunk), WAVE_CHUNK):
+                block = chunk[start:start + WAVE_CHUNK]
+                if len(block) > 1 and _is_constant(block):
+                    # Drain the pipeline, then let the daemon loop a
+                    # one-sample wave for the whole run on its own.
+                    if prev_wid is not None:
+                        while pi.wave_tx_busy():
+                            time.sleep(0.001)
+                        pi.wave_delete(prev_wid)
+                        prev_wid = None
+                    pi.wave_add_generic(_sample_pulses(block[:1], bit, cycles,
+                                                       cycle_us, on_lut))
+                    wid = pi.wave_create()
+                    n = len(block)
+                    pi.wave_chain([255, 0, wid, 255, 1, n & 255, n >> 8])
+                    while pi.wave_tx_busy():
+                        time.sleep(0.001)
+                    pi.wave_delete(wid)
+                    continue
+                pulses = _sample_pulses(block, bit, cycles, cycle_us, on_lut)
+                pi.wave_add_generic(pulses)
+                wid = pi.wave_create()
+                pi.wave_send_using_mode(wid, pigpio.WAVE_MODE_ONE_SHOT_SYNC)
+                if prev_wid is not None:
+                    # Wait for the previous wave to finish, then free it.
+                    while pi.wave_tx_at() == prev_wid:
+                        time.sleep(0.001)
+                    pi.wave_delete(prev_wid)
+                prev_wid = wid
+        while pi.wave_tx_busy():
+            time.sleep(0.001)
+    finally:
+        if prev_wid is not None:
+            pi.wave_delete(prev_wid)
+        pi.write(gpio, 0)
+
+
+def _prefetch(chunks, depth=8):
+    """Decode ahead of playback in a background thread.
+
+    A producer thread pulls chunks from the source generator into a bounded
+    queue while the caller streams them out, overlapping WAV decode with the
+    pigpio I/O (numpy array ops and blocking socket calls both release the
+    GIL). The queue is pre-filled before the first chunk is yielded so
+    playback starts with a full buffer.
+    """
+    q = queue.Queue(maxsize=depth)
+    _done = object()
+
+    def producer():
+        try:
+            for chunk in chunks:
+                q.put(chunk)
+            q.put(_done)
+        except BaseException as e:
+            q.put(e)
+
+    t = threading.Thread(target=producer, daemon=True)
+    t.start()
+    while not q.full() and t.is_alive():
+        time.sleep(0.001)
+
+    def gen():
+        while True:
+            item = q.get()
+            if item is _done:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+    return gen()
+
+
+def _apply_gain(chunks, gain):
+    """Yield chunks with gain applied, clipped to 0..255.
+
+    The whole scale-and-clip is compiled into a 256-byte table once, then
+    each chunk is mapped through it with a single bytes.translate call --
+    one C-level pass per chunk, no per-sample arithmetic, numpy or not.
+    """
+    table = bytes(min(255, max(0, int(s * gain))) for s in range(256))
+    for chunk in chunks:
+        yield bytes(chunk).translate(table)
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--wav', required=True, help='Path to mono WAV file')
@@ -81,13 +399,17 @@ def main():
     parser.add_argument('--rate', type=int, default=None, help='Playback sample rate (optional)')
     parser.add_argument('--gain', type=float, default=1.0, help='Playback gain (1.0 = no change, >1 amplify, clipped)')
     parser.add_argument('--carrier', type=int, default=25000, help='PWM carrier frequency in Hz (default 25000)')
+    parser.add_argument('--method', choices=['wave', 'socket', 'script', 'pwm'], default='wave',
+                        help='Streaming method: batched pigpio waves (default), pipelined '
+                             'socket frames, a daemon-side stored script, or per-sample '
+                             'hardware_PWM')
     args = parser.parse_args()
 
     if not os.path.exists(args.wav):
         print('WAV file not found:', args.wav, file=sys.stderr)
         sys.exit(2)
 
-    samples, framerate = wav_to_samples(args.wav)
+    chunks, framerate = wav_chunks(args.wav)
     if args.rate and args.rate != framerate:
         print('Warning: WAV sample rate {} differs from requested rate {}'.format(framerate, args.rate))
 
@@ -97,28 +419,22 @@ def main():
         sys.exit(3)
 
     try:
-        # Apply gain (scale samples, clip to 0..255)
+        # Apply gain (scale samples, clip to 0..255) chunk by chunk
         if args.gain != 1.0:
-            scaled = []
-            for s in samples:
-                v = int(s * args.gain)
-                if v < 0:
-                    v = 0
-                elif v > 255:
-                    v = 255
-                scaled.append(v)
-            samples = scaled
+            chunks = _apply_gain(chunks, args.gain)
+
+        # Decode in the background so streaming never waits on the file
+        chunks = _prefetch(chunks)
 
         # Stream using requested carrier
-        def stream_with_carrier(samples_local, sr, gpio_local, pi_local, carrier_hz):
-            pi_local.set_mode(gpio_local, pigpio.OUTPUT)
-            pi_local.hardware_PWM(gpio_local, carrier_hz, 0)
-            for s in samples_local:
-                duty = int(s * 1000000 / 255)
-                pi_local.hardware_PWM(gpio_local, carrier_hz, duty)
-            pi_local.hardware_PWM(gpio_local, 0, 0)
-
-        stream_with_carrier(samples, framerate, args.gpio, pi, args.carrier)
+        if args.method == 'wave':
+            stream_pwm_wave(chunks, framerate, args.gpio, pi, carrier=args.carrier)
+        elif args.method == 'socket':
+            stream_pwm_socket(chunks, framerate, args.gpio, pi, carrier=args.carrier)
+        elif args.method == 'script':
+            stream_pwm_script(chunks, framerate, args.gpio, pi, carrier=args.carrier)
+        else:
+            stream_pwm(chunks, framerate, args.gpio, pi, carrier=args.carrier)
     finally:
         pi.stop()
 
@@ -10,19 +10,32 @@ This script tries multiple local TTS/playback methods in order of preference:
 It intentionally does NOT attempt to drive a speaker from GPIO pins. See README for wiring and safety.
 """
 
-import argparse
+# Keep module-level imports light so `from synth import speak` is cheap;
+# argparse, subprocess, tempfile and fcntl are pulled in where needed.
+import functools
 import shutil
-import subprocess
-import tempfile
+import threading
 import sys
 import os
 
 
+@functools.lru_cache(maxsize=None)
 def command_exists(cmd: str) -> bool:
+    # Kept for callers that want to introspect available backends; the TTS
+    # functions themselves just attempt the launch and let a missing binary
+    # surface as FileNotFoundError. Cached: PATH rarely changes within a
+    # process and each lookup costs a stat() per PATH entry.
     return shutil.which(cmd) is not None
 
 
+# The TTS backend that last worked; reused by speak() so repeat calls skip
+# re-probing the alternatives.
+_chosen = None
+
+
 def play_wav(path: str, device: str | None = None) -> None:
+    import subprocess
+
     cmd = ["aplay", path]
     if device:
         cmd += ["-D", device]
@@ -30,24 +43,56 @@ def play_wav(path: str, device: str | None = None) -> None:
 
 
 def tts_espeak(text: str, device: str | None = None) -> bool:
-    """Use espeak to write WAV to stdout and pipe into aplay."""
-    if not command_exists("espeak"):
-        raise RuntimeError("espeak not found")
+    """Use espeak to write WAV to stdout and pipe into aplay.
+
+    The two processes are launched with os.posix_spawnp rather than
+    subprocess.Popen: piped Popen setups fall back to fork()+exec(), and
+    forking duplicates the Python heap's page tables, which is slow on a
+    memory-constrained Pi. posix_spawn skips that entirely.
+    """
+    import fcntl
+
     cmd_espeak = ["espeak", "--stdout", text]
-    p1 = subprocess.Popen(cmd_espeak, stdout=subprocess.PIPE)
     cmd_aplay = ["aplay"]
     if device:
         cmd_aplay += ["-D", device]
-    p2 = subprocess.Popen(cmd_aplay, stdin=p1.stdout)
-    p1.stdout.close()
-    p2.communicate()
-    return p2.returncode == 0
+
+    r, w = os.pipe()
+    pids = []
+    try:
+        try:
+            # Grow the kernel pipe to 1 MiB so espeak doesn't block on
+            # every 64 KiB that aplay drains.
+            fcntl.fcntl(w, fcntl.F_SETPIPE_SZ, 1 << 20)
+        except (AttributeError, OSError):
+            pass  # non-Linux, or pipe size capped; the default is still fine
+        pids.append(os.posix_spawnp(
+            cmd_espeak[0], cmd_espeak, os.environ,
+            file_actions=[(os.POSIX_SPAWN_DUP2, w, 1),
+                          (os.POSIX_SPAWN_CLOSE, r),
+                          (os.POSIX_SPAWN_CLOSE, w)]))
+        pids.append(os.posix_spawnp(
+            cmd_aplay[0], cmd_aplay, os.environ,
+            file_actions=[(os.POSIX_SPAWN_DUP2, r, 0),
+                          (os.POSIX_SPAWN_CLOSE, r),
+                          (os.POSIX_SPAWN_CLOSE, w)]))
+    finally:
+        # The parent must drop both ends so aplay sees EOF when espeak exits.
+        os.close(r)
+        os.close(w)
+        if len(pids) == 1:
+            os.waitpid(pids[0], 0)  # aplay failed to spawn; reap espeak
+
+    os.waitpid(pids[0], 0)
+    _, status = os.waitpid(pids[1], 0)
+    return os.waitstatus_to_exitcode(status) == 0
 
 
 def tts_pico2wave(text: str, device: str | None = None) -> bool:
     """Generate WAV with pico2wave then play with aplay."""
-    if not command_exists("pico2wave"):
-        raise RuntimeError("pico2wave not found")
+    import subprocess
+    import tempfile
+
     fd, wav = tempfile.mkstemp(suffix=".wav")
     os.close(fd)
     try:
@@ -61,25 +106,42 @@ def tts_pico2wave(text: str, device: str | None = None) -> bool:
             pass
 
 
+# pyttsx3 driver init is slow (hundreds of ms); keep one engine for the
+# process. Engines aren't reentrant, so serialize access with a lock.
+_engine = None
+_engine_lock = threading.Lock()
+
+
 def tts_pyttsx3(text: str, device: str | None = None) -> bool:
     """Try pyttsx3 as a Python fallback. This uses the system audio backend."""
-    try:
-        import pyttsx3
-    except Exception as e:
-        raise RuntimeError("pyttsx3 not available: " + str(e))
-    engine = pyttsx3.init()
-    engine.say(text)
-    engine.runAndWait()
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            try:
+                import pyttsx3
+            except Exception as e:
+                raise RuntimeError("pyttsx3 not available: " + str(e))
+            _engine = pyttsx3.init()
+        _engine.say(text)
+        _engine.runAndWait()
     return True
 
 
 def speak(text: str, device: str | None = None, simulate: bool = False) -> None:
+    global _chosen
     if not text:
         raise ValueError("No text provided")
     if simulate:
         print("[simulate] would speak:", text)
         return
 
+    if _chosen is not None:
+        try:
+            if _chosen(text, device=device):
+                return
+        except Exception:
+            _chosen = None  # backend stopped working; re-probe below
+
     errors = []
     for fn in (tts_espeak, tts_pico2wave, tts_pyttsx3):
         try:
@@ -88,6 +150,7 @@ def speak(text: str, device: str | None = None, simulate: bool = False) -> None:
                 pass
             success = fn(text, device=device)
             if success:
+                _chosen = fn
                 return
         except Exception as e:
             errors.append(f"{fn.__name__}: {e}")
@@ -97,6 +160,8 @@ def speak(text: str, device: str | None = None, simulate: bool = False) -> None:
 
 
 def main():
+    import argparse
+
     parser = argparse.ArgumentParser(description="Raspberry Pi voice synthesizer helper")
     parser.add_argument("text", nargs="+", help="Text to speak (quote it)")
     parser.add_argument("--device", help="ALSA device for aplay, e.g. 'plughw:0,0'", default=None)